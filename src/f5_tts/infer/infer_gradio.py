@@ -6,18 +6,18 @@ import json
 import os
 import re
 import tempfile
-from collections import OrderedDict
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, wait
 from functools import lru_cache
 from importlib.resources import files
+from threading import Event, Lock
 
 import click
 import gradio as gr
 import numpy as np
-import soundfile as sf
 import torch
-import torchaudio
 from cached_path import cached_path
-from transformers import AutoModelForCausalLM, AutoTokenizer
 
 
 try:
@@ -27,6 +27,11 @@ try:
 except ImportError:
     USING_SPACES = False
 
+# avoid OpenMP/MKL oversubscription on CPU-only inference, unless thread count is set explicitly via env
+if not USING_SPACES and not torch.cuda.is_available() and "OMP_NUM_THREADS" not in os.environ:
+    torch.set_num_threads(1)
+    torch.set_num_interop_threads(1)
+
 
 def gpu_decorator(func):
     if USING_SPACES:
@@ -40,9 +45,8 @@ from f5_tts.infer.utils_infer import (
     load_model,
     load_vocoder,
     preprocess_ref_audio_text,
-    remove_silence_for_generated_wav,
+    remove_silence_from_wave,
     save_spectrogram,
-    tempfile_kwargs,
 )
 from f5_tts.model import DiT, UNetT
 
@@ -57,6 +61,14 @@ DEFAULT_TTS_MODEL_CFG = [
 ]
 
 
+# optional precision override for the TTS models: fp32, fp16 or bf16 (default: fp16 on Volta+ CUDA, else fp32)
+model_dtype_map = {"fp32": torch.float32, "fp16": torch.float16, "bf16": torch.bfloat16}
+model_precision = os.environ.get("F5_PRECISION", "").lower()
+if model_precision and model_precision not in model_dtype_map:
+    raise ValueError(f"Unsupported F5_PRECISION={model_precision!r}, expected one of {', '.join(model_dtype_map)}")
+model_dtype = model_dtype_map.get(model_precision)
+
+
 # load models
 
 vocoder = load_vocoder()
@@ -65,13 +77,13 @@ vocoder = load_vocoder()
 def load_f5tts():
     ckpt_path = str(cached_path(DEFAULT_TTS_MODEL_CFG[0]))
     F5TTS_model_cfg = json.loads(DEFAULT_TTS_MODEL_CFG[2])
-    return load_model(DiT, F5TTS_model_cfg, ckpt_path)
+    return load_model(DiT, F5TTS_model_cfg, ckpt_path, dtype=model_dtype)
 
 
 def load_e2tts():
     ckpt_path = str(cached_path("hf://SWivid/E2-TTS/E2TTS_Base/model_1200000.safetensors"))
     E2TTS_model_cfg = dict(dim=1024, depth=24, heads=16, ff_mult=4, text_mask_padding=False, pe_attn_head=1)
-    return load_model(UNetT, E2TTS_model_cfg, ckpt_path)
+    return load_model(UNetT, E2TTS_model_cfg, ckpt_path, dtype=model_dtype)
 
 
 def load_custom(ckpt_path: str, vocab_path="", model_cfg=None):
@@ -84,38 +96,82 @@ def load_custom(ckpt_path: str, vocab_path="", model_cfg=None):
         model_cfg = json.loads(DEFAULT_TTS_MODEL_CFG[2])
     elif isinstance(model_cfg, str):
         model_cfg = json.loads(model_cfg)
-    return load_model(DiT, model_cfg, ckpt_path, vocab_file=vocab_path)
+    return load_model(DiT, model_cfg, ckpt_path, vocab_file=vocab_path, dtype=model_dtype)
 
 
 F5TTS_ema_model = load_f5tts()
 E2TTS_ema_model = load_e2tts() if USING_SPACES else None
 custom_ema_model, pre_custom_path = None, ""
 
+# serialize TTS inference across tabs and sessions, runs sharing one GPU only compete for memory
+tts_inference_lock = Lock()
+
 chat_model_state = None
 chat_tokenizer_state = None
 
+# chat generation always runs on this one worker thread, reusing the per-thread CUDA state set up by the warmup
+chat_generation_executor = ThreadPoolExecutor(max_workers=1)
+
+# number of infer() results kept by its lru_cache
+infer_cache_size = 100
+
+# spectrogram images live in one temp dir, the oldest deleted first once there are as many as cached infer() results;
+# a frequently reused cached result can still outlive its image, load_spectrogram() then returns None
+spectrogram_dir = tempfile.mkdtemp(prefix="f5tts_")
+spectrogram_paths = deque()
+max_spectrograms = infer_cache_size
+
+# spectrogram images are rendered in the background, single worker as pyplot is not thread-safe
+spectrogram_executor = ThreadPoolExecutor(max_workers=1)
+spectrogram_futures = {}
+
 
 @gpu_decorator
-def chat_model_inference(messages, model, tokenizer):
-    """Generate response using Qwen"""
+def chat_model_inference(messages, model, tokenizer, max_new_tokens=512, timeout=300.0):
+    """Generate response using Qwen, yielding text pieces as they are decoded"""
+    from transformers import StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+
+    # set when the consumer stops iterating (finished, cancelled or failed), ending generation at the next token
+    stop_event = Event()
+
+    class StopOnEvent(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            return torch.full((input_ids.shape[0],), stop_event.is_set(), dtype=torch.bool, device=input_ids.device)
+
     text = tokenizer.apply_chat_template(
         messages,
         tokenize=False,
         add_generation_prompt=True,
     )
 
-    model_inputs = tokenizer([text], return_tensors="pt").to(model.device)
-    generated_ids = model.generate(
-        **model_inputs,
-        max_new_tokens=512,
-        temperature=0.7,
-        top_p=0.95,
-    )
+    model_inputs = tokenizer([text], return_tensors="pt")
+    if model.device.type == "cuda":  # pinned host memory for an async copy, ordered before generate on the stream
+        model_inputs = {k: v.pin_memory().to(model.device, non_blocking=True) for k, v in model_inputs.items()}
+    else:
+        model_inputs = model_inputs.to(model.device)
+    # timeout: raise in the consumer instead of waiting forever if no token arrives
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True, timeout=timeout)
 
-    generated_ids = [
-        output_ids[len(input_ids) :] for input_ids, output_ids in zip(model_inputs.input_ids, generated_ids)
-    ]
-    return tokenizer.batch_decode(generated_ids, skip_special_tokens=True)[0]
+    def generate():
+        try:
+            model.generate(
+                **model_inputs,
+                streamer=streamer,
+                stopping_criteria=StoppingCriteriaList([StopOnEvent()]),
+                max_new_tokens=max_new_tokens,
+                temperature=0.7,
+                top_p=0.95,
+            )
+        except Exception:
+            streamer.end()  # unblock the consumer, the error is re-raised there
+            raise
+
+    generation_future = chat_generation_executor.submit(generate)
+    try:
+        yield from streamer
+    finally:
+        stop_event.set()
+    generation_future.result()
 
 
 @gpu_decorator
@@ -128,7 +184,7 @@ def load_text_from_file(file):
     return gr.update(value=text)
 
 
-@lru_cache(maxsize=100)  # NOTE. need to ensure params of infer() hashable
+@lru_cache(maxsize=infer_cache_size)  # NOTE. need to ensure params of infer() hashable
 @gpu_decorator
 def infer(
     ref_audio_orig,
@@ -141,6 +197,7 @@ def infer(
     nfe_step=32,
     speed=1,
     show_info=gr.Info,
+    render_spectrogram=True,
 ):
     if not ref_audio_orig:
         gr.Warning("Please provide reference audio.")
@@ -176,39 +233,54 @@ def infer(
             pre_custom_path = model[1]
         ema_model = custom_ema_model
 
-    final_wave, final_sample_rate, combined_spectrogram = infer_process(
-        ref_audio,
-        ref_text,
-        gen_text,
-        ema_model,
-        vocoder,
-        cross_fade_duration=cross_fade_duration,
-        nfe_step=nfe_step,
-        speed=speed,
-        show_info=show_info,
-        progress=gr.Progress(),
-    )
+    with tts_inference_lock:
+        final_wave, final_sample_rate, combined_spectrogram = infer_process(
+            ref_audio,
+            ref_text,
+            gen_text,
+            ema_model,
+            vocoder,
+            cross_fade_duration=cross_fade_duration,
+            nfe_step=nfe_step,
+            speed=speed,
+            show_info=show_info,
+            progress=gr.Progress(),
+        )
 
     # Remove silence
     if remove_silence:
-        with tempfile.NamedTemporaryFile(suffix=".wav", **tempfile_kwargs) as f:
-            temp_path = f.name
+        final_wave = remove_silence_from_wave(final_wave, final_sample_rate)
+
+    # Save the spectrogram in the background, dropping the oldest one if over the limit
+    if not render_spectrogram:
+        return (final_sample_rate, final_wave), None, ref_text, used_seed
+
+    spectrogram_path = os.path.join(spectrogram_dir, f"spec_{uuid.uuid4().hex}.png")
+    spectrogram_futures[spectrogram_path] = spectrogram_executor.submit(
+        save_spectrogram, combined_spectrogram, spectrogram_path
+    )
+    spectrogram_paths.append(spectrogram_path)
+    if len(spectrogram_paths) > max_spectrograms:
+        oldest_path = spectrogram_paths.popleft()
+        wait([spectrogram_futures.pop(oldest_path)])  # render errors are only reported by load_spectrogram()
         try:
-            sf.write(temp_path, final_wave, final_sample_rate)
-            remove_silence_for_generated_wav(f.name)
-            final_wave, _ = torchaudio.load(f.name)
-        finally:
-            os.unlink(temp_path)
-        final_wave = final_wave.squeeze().cpu().numpy()
-
-    # Save the spectrogram
-    with tempfile.NamedTemporaryFile(suffix=".png", **tempfile_kwargs) as tmp_spectrogram:
-        spectrogram_path = tmp_spectrogram.name
-    save_spectrogram(combined_spectrogram, spectrogram_path)
+            os.unlink(oldest_path)
+        except FileNotFoundError:
+            pass
 
     return (final_sample_rate, final_wave), spectrogram_path, ref_text, used_seed
 
 
+def load_spectrogram(spectrogram_path):
+    """Wait for the spectrogram image of an infer() result to be rendered"""
+    future = spectrogram_futures.get(spectrogram_path)
+    if future is not None:
+        future.result()
+    if not spectrogram_path or not os.path.exists(spectrogram_path):  # cached result outlived its image
+        return None
+    return spectrogram_path
+
+
 with gr.Blocks() as app_credits:
     gr.Markdown("""
 # Credits
@@ -279,6 +351,7 @@ with gr.Blocks() as app_tts:
 
     audio_output = gr.Audio(label="Synthesized Audio")
     spectrogram_output = gr.Image(label="Spectrogram")
+    spectrogram_path_state = gr.State()
 
     @gpu_decorator
     def basic_tts(
@@ -333,17 +406,19 @@ with gr.Blocks() as app_tts:
             nfe_slider,
             speed_slider,
         ],
-        outputs=[audio_output, spectrogram_output, ref_text_input, seed_input],
+        outputs=[audio_output, spectrogram_path_state, ref_text_input, seed_input],
+    ).then(
+        load_spectrogram,
+        inputs=[spectrogram_path_state],
+        outputs=[spectrogram_output],
     )
 
 
-def parse_speechtypes_text(gen_text):
-    # Pattern to find {str} or {"name": str, "seed": int, "speed": float}
-    pattern = r"(\{.*?\})"
+# Pattern to find {str} or {"name": str, "seed": int, "speed": float}
+_SPEECH_TYPE_RE = re.compile(r"(\{.*?\})")
 
-    # Split the text by the pattern
-    tokens = re.split(pattern, gen_text)
 
+def parse_speechtypes_text(gen_text):
     segments = []
 
     current_type_dict = {
@@ -352,21 +427,25 @@ def parse_speechtypes_text(gen_text):
         "speed": 1.0,
     }
 
-    for i in range(len(tokens)):
-        if i % 2 == 0:
-            # This is text
-            text = tokens[i].strip()
-            if text:
-                current_type_dict["text"] = text
-                segments.append(current_type_dict)
-        else:
-            # This is type
-            type_str = tokens[i].strip()
-            try:  # if type dict
-                current_type_dict = json.loads(type_str)
-            except json.decoder.JSONDecodeError:
-                type_str = type_str[1:-1]  # remove brace {}
-                current_type_dict = {"name": type_str, "seed": -1, "speed": 1.0}
+    def append_segment(text):
+        text = text.strip()
+        if text:
+            current_type_dict["text"] = text
+            segments.append(current_type_dict)
+
+    # Single pass over the type markers, emitting the text between them
+    pos = 0
+    for match in _SPEECH_TYPE_RE.finditer(gen_text):
+        append_segment(gen_text[pos : match.start()])
+        pos = match.end()
+
+        type_str = match.group(1).strip()
+        try:  # if type dict
+            current_type_dict = json.loads(type_str)
+        except json.decoder.JSONDecodeError:
+            type_str = type_str[1:-1]  # remove brace {}
+            current_type_dict = {"name": type_str, "seed": -1, "speed": 1.0}
+    append_segment(gen_text[pos:])
 
     return segments
 
@@ -572,7 +651,7 @@ with gr.Blocks() as app_multistyle:
     generate_multistyle_btn = gr.Button("Generate Multi-Style Speech", variant="primary")
 
     # Output audio
-    audio_output_multistyle = gr.Audio(label="Synthesized Audio")
+    audio_output_multistyle = gr.Audio(label="Synthesized Audio", autoplay=True, streaming=True)
 
     # Used seed gallery
     cherrypick_interface_multistyle = gr.Textbox(
@@ -623,8 +702,17 @@ with gr.Blocks() as app_multistyle:
         # Parse the gen_text into segments
         segments = parse_speechtypes_text(gen_text)
 
-        # For each segment, generate speech
-        generated_audio_segments = []
+        # Merge consecutive segments sharing name, seed and speed, so each run needs a single inference
+        merged_segments = []
+        for segment in segments:
+            if merged_segments and all(merged_segments[-1][key] == segment[key] for key in ("name", "seed", "speed")):
+                merged_segments[-1]["text"] += " " + segment["text"]
+            else:
+                merged_segments.append(dict(segment))
+        segments = merged_segments
+
+        # For each segment, generate speech and stream it out, other outputs are only final after the last one
+        generated_any = False
         current_type_name = "Regular"
         inference_meta_data = ""
 
@@ -644,7 +732,8 @@ with gr.Blocks() as app_multistyle:
                 ref_audio = speech_types[current_type_name]["audio"]
             except KeyError:
                 gr.Warning(f"Please provide reference audio for type {current_type_name}.")
-                return [None] + [speech_types[name]["ref_text"] for name in speech_types] + [None]
+                yield [None] + [speech_types[name]["ref_text"] for name in speech_types] + [None]
+                return
             ref_text = speech_types[current_type_name].get("ref_text", "")
 
             if seed_input == -1:
@@ -661,24 +750,18 @@ with gr.Blocks() as app_multistyle:
                 cross_fade_duration=0,
                 speed=speed,
                 show_info=print,  # no pull to top when generating
+                render_spectrogram=False,
             )
-            sr, audio_data = audio_out
-
-            generated_audio_segments.append(audio_data)
+            generated_any = True
             speech_types[current_type_name]["ref_text"] = ref_text_out
             inference_meta_data += json.dumps(dict(name=name, seed=used_seed, speed=speed)) + f" {text}\n"
+            yield [audio_out] + [gr.update() for _ in speech_types] + [gr.update()]
 
-        # Concatenate all audio segments
-        if generated_audio_segments:
-            final_audio_data = np.concatenate(generated_audio_segments)
-            return (
-                [(sr, final_audio_data)]
-                + [speech_types[name]["ref_text"] for name in speech_types]
-                + [inference_meta_data]
-            )
+        if generated_any:
+            yield [gr.update()] + [speech_types[name]["ref_text"] for name in speech_types] + [inference_meta_data]
         else:
             gr.Warning("No audio generated.")
-            return [None] + [speech_types[name]["ref_text"] for name in speech_types] + [None]
+            yield [None] + [speech_types[name]["ref_text"] for name in speech_types] + [None]
 
     generate_multistyle_btn.click(
         generate_multistyle_speech,
@@ -739,6 +822,10 @@ Have a conversation with an AI using your reference voice!
 """
     )
 
+    # end of a sentence in the chat response, which can then be sent to TTS: punctuation followed by whitespace
+    # (so not "3.5" or "e.g"), or a full-width CJK mark
+    sentence_end_re = re.compile(r"[.!?؟]\s|[。！？]")
+
     chat_model_name_list = [
         "Qwen/Qwen2.5-3B-Instruct",
         "microsoft/Phi-4-mini-instruct",
@@ -755,8 +842,19 @@ Have a conversation with an AI using your reference voice!
             torch.cuda.empty_cache()
 
         show_info(f"Loading chat model: {chat_model_name}")
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
         chat_model_state = AutoModelForCausalLM.from_pretrained(chat_model_name, torch_dtype="auto", device_map="auto")
         chat_tokenizer_state = AutoTokenizer.from_pretrained(chat_model_name)
+
+        if torch.cuda.is_available() and not USING_SPACES:
+            # Short eager generation on the chat worker thread, so CUDA kernel loading and the per-thread cuBLAS
+            # handle setup happen here instead of in the first chat turn. No static cache or compilation: the chat
+            # history grows every turn, so fixed kv-cache shapes would be rebuilt and recompiled on most turns.
+            warmup_messages = [{"role": "user", "content": "Hello"}]
+            for _ in chat_model_inference(warmup_messages, chat_model_state, chat_tokenizer_state, max_new_tokens=4):
+                pass
+
         show_info(f"Chat model {chat_model_name} loaded successfully!")
 
         return gr.update(visible=False), gr.update(visible=True)
@@ -826,7 +924,7 @@ Have a conversation with an AI using your reference voice!
                     label="Speak your message",
                     type="filepath",
                 )
-                audio_output_chat = gr.Audio(autoplay=True)
+                audio_output_chat = gr.Audio(autoplay=True, streaming=True)
             with gr.Column():
                 text_input_chat = gr.Textbox(
                     label="Type your message",
@@ -851,42 +949,59 @@ Have a conversation with an AI using your reference voice!
             conv_state.append({"role": "user", "content": text})
             return conv_state
 
-        # Use model and tokenizer from state to get text response
-        @gpu_decorator
-        def generate_text_response(conv_state, system_prompt):
-            """Generate text response from AI"""
-
-            system_prompt_state = [{"role": "system", "content": system_prompt}]
-            response = chat_model_inference(system_prompt_state + conv_state, chat_model_state, chat_tokenizer_state)
-
-            conv_state.append({"role": "assistant", "content": response})
-            return conv_state
-
+        # Use model and tokenizer from state to get text response, speaking each sentence once it is complete
         @gpu_decorator
-        def generate_audio_response(conv_state, ref_audio, ref_text, remove_silence, randomize_seed, seed_input):
-            """Generate TTS audio for AI response"""
-            if not conv_state or not ref_audio:
-                return None, ref_text, seed_input
-
-            last_ai_response = conv_state[-1]["content"]
-            if not last_ai_response or conv_state[-1]["role"] != "assistant":
-                return None, ref_text, seed_input
+        def generate_chat_response(
+            conv_state, system_prompt, ref_audio, ref_text, remove_silence, randomize_seed, seed_input
+        ):
+            """Generate text response from AI and stream its TTS audio"""
+            if not conv_state or conv_state[-1]["role"] != "user":
+                yield conv_state, None, ref_text, seed_input
+                return
 
             if randomize_seed:
                 seed_input = np.random.randint(0, 2**31 - 1)
 
-            audio_result, _, ref_text_out, used_seed = infer(
-                ref_audio,
-                ref_text,
-                last_ai_response,
-                tts_model_choice,
-                remove_silence,
-                seed=seed_input,
-                cross_fade_duration=0.15,
-                speed=1.0,
-                show_info=print,  # show_info=print no pull to top when generating
-            )
-            return audio_result, ref_text_out, used_seed
+            def speak(sentence):
+                nonlocal ref_text
+                audio_result, _, ref_text_out, _ = infer(
+                    ref_audio,
+                    ref_text,
+                    sentence,
+                    tts_model_choice,
+                    remove_silence,
+                    seed=seed_input,
+                    cross_fade_duration=0.15,
+                    speed=1.0,
+                    show_info=print,  # show_info=print no pull to top when generating
+                    render_spectrogram=False,
+                )
+                ref_text_update = gr.update() if ref_text_out == ref_text else ref_text_out
+                ref_text = ref_text_out
+                return audio_result, ref_text_update
+
+            system_prompt_state = [{"role": "system", "content": system_prompt}]
+            messages = system_prompt_state + conv_state
+            conv_state.append({"role": "assistant", "content": ""})
+
+            # text not yet spoken, flushed up to its last complete sentence; the seed is only sent once
+            pending = ""
+            seed_update = seed_input
+            for new_text in chat_model_inference(messages, chat_model_state, chat_tokenizer_state):
+                conv_state[-1]["content"] += new_text
+                pending += new_text
+                boundary = max((match.end() for match in sentence_end_re.finditer(pending)), default=0)
+                if ref_audio and pending[:boundary].strip():
+                    audio_chunk, ref_text_update = speak(pending[:boundary].strip())
+                    pending = pending[boundary:]
+                    yield conv_state, audio_chunk, ref_text_update, seed_update
+                else:
+                    yield conv_state, gr.update(), gr.update(), seed_update
+                seed_update = gr.update()
+
+            if ref_audio and pending.strip():
+                audio_chunk, ref_text_update = speak(pending.strip())
+                yield conv_state, audio_chunk, ref_text_update, seed_update
 
         def clear_conversation():
             """Reset the conversation"""
@@ -904,20 +1019,17 @@ Have a conversation with an AI using your reference voice!
                 inputs=[chatbot_interface, audio_input_chat, text_input_chat],
                 outputs=[chatbot_interface],
             ).then(
-                generate_text_response,
-                inputs=[chatbot_interface, system_prompt_chat],
-                outputs=[chatbot_interface],
-            ).then(
-                generate_audio_response,
+                generate_chat_response,
                 inputs=[
                     chatbot_interface,
+                    system_prompt_chat,
                     ref_audio_chat,
                     ref_text_chat,
                     remove_silence_chat,
                     randomize_seed_chat,
                     seed_input_chat,
                 ],
-                outputs=[audio_output_chat, ref_text_chat, seed_input_chat],
+                outputs=[chatbot_interface, audio_output_chat, ref_text_chat, seed_input_chat],
             ).then(
                 lambda: [None, None],
                 None,
@@ -1068,6 +1180,10 @@ If you're having issues, try converting your reference audio to WAV or MP3, clip
     )
 
 
+# requests waiting beyond this are rejected rather than piling up behind the GPU
+max_queue_size = 16
+
+
 @click.command()
 @click.option("--port", "-p", default=None, type=int, help="Port to run the app on")
 @click.option("--host", "-H", default=None, help="Host to run the app on")
@@ -1096,7 +1212,7 @@ If you're having issues, try converting your reference audio to WAV or MP3, clip
 def main(port, host, share, api, root_path, inbrowser):
     global app
     print("Starting app...")
-    app.queue(api_open=api).launch(
+    app.queue(api_open=api, default_concurrency_limit=1, max_size=max_queue_size).launch(
         server_name=host,
         server_port=port,
         share=share,
@@ -1110,4 +1226,4 @@ if __name__ == "__main__":
     if not USING_SPACES:
         main()
     else:
-        app.queue().launch()
+        app.queue(default_concurrency_limit=1, max_size=max_queue_size).launch()
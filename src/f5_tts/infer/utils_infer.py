@@ -25,7 +25,6 @@ import torchaudio
 import tqdm
 from huggingface_hub import hf_hub_download
 from pydub import AudioSegment, silence
-from transformers import pipeline
 from vocos import Vocos
 
 from f5_tts.model import CFM
@@ -34,6 +33,7 @@ from f5_tts.model.utils import convert_char_to_pinyin, get_tokenizer
 
 _ref_audio_cache = {}
 _ref_text_cache = {}
+_ref_audio_hash_cache = {}
 
 device = (
     "cuda"
@@ -69,6 +69,9 @@ fix_duration = None
 
 # chunk text into smaller pieces
 
+# Split the text into sentences based on punctuation followed by whitespace
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[;:,.!?])\s+|(?<=[；：，。！？])")
+
 
 def chunk_text(text, max_chars=135):
     """
@@ -83,8 +86,7 @@ def chunk_text(text, max_chars=135):
     """
     chunks = []
     current_chunk = ""
-    # Split the text into sentences based on punctuation followed by whitespace
-    sentences = re.split(r"(?<=[;:,.!?])\s+|(?<=[；：，。！？])", text)
+    sentences = _SENTENCE_SPLIT_RE.split(text)
 
     for sentence in sentences:
         if len(current_chunk.encode("utf-8")) + len(sentence.encode("utf-8")) <= max_chars:
@@ -157,6 +159,8 @@ def initialize_asr_pipeline(device: str = device, dtype=None):
             and not torch.cuda.get_device_name().endswith("[ZLUDA]")
             else torch.float32
         )
+    from transformers import pipeline
+
     global asr_pipe
     asr_pipe = pipeline(
         "automatic-speech-recognition",
@@ -243,6 +247,7 @@ def load_model(
     ode_method=ode_method,
     use_ema=False,
     device=device,
+    dtype=None,
 ):
     use_ema=False
     if vocab_file == "" :
@@ -270,7 +275,8 @@ def load_model(
         vocab_char_map=vocab_char_map,
     ).to(device)
 
-    dtype = torch.float32 if mel_spec_type == "bigvgan" else None
+    if mel_spec_type == "bigvgan":
+        dtype = torch.float32
     model = load_checkpoint(model, ckpt_path, device, dtype=dtype, use_ema=use_ema)
 
     return model
@@ -298,10 +304,16 @@ def remove_silence_edges(audio, silence_threshold=-42):
 def preprocess_ref_audio_text(ref_audio_orig, ref_text, show_info=print):
     show_info("Converting audio...")
 
-    # Compute a hash of the reference audio file
-    with open(ref_audio_orig, "rb") as audio_file:
-        audio_data = audio_file.read()
-        audio_hash = hashlib.md5(audio_data).hexdigest()
+    # Compute a hash of the reference audio file, reusing it while the file is unchanged
+    audio_stat = os.stat(ref_audio_orig)
+    audio_key = (os.path.abspath(ref_audio_orig), audio_stat.st_mtime_ns, audio_stat.st_size)
+    if audio_key in _ref_audio_hash_cache:
+        audio_hash = _ref_audio_hash_cache[audio_key]
+    else:
+        with open(ref_audio_orig, "rb") as audio_file:
+            audio_data = audio_file.read()
+            audio_hash = hashlib.md5(audio_data).hexdigest()
+        _ref_audio_hash_cache[audio_key] = audio_hash
 
     global _ref_audio_cache
 
@@ -539,38 +551,35 @@ def infer_batch_process(
                 # Simply concatenate
                 final_wave = np.concatenate(generated_waves)
             else:
-                # Combine all generated waves with cross-fading
-                final_wave = generated_waves[0]
-                for i in range(1, len(generated_waves)):
-                    prev_wave = final_wave
-                    next_wave = generated_waves[i]
-
-                    # Calculate cross-fade samples, ensuring it does not exceed wave lengths
-                    cross_fade_samples = int(cross_fade_duration * target_sample_rate)
-                    cross_fade_samples = min(cross_fade_samples, len(prev_wave), len(next_wave))
-
-                    if cross_fade_samples <= 0:
-                        # No overlap possible, concatenate
-                        final_wave = np.concatenate([prev_wave, next_wave])
-                        continue
-
-                    # Overlapping parts
-                    prev_overlap = prev_wave[-cross_fade_samples:]
-                    next_overlap = next_wave[:cross_fade_samples]
-
-                    # Fade out and fade in
-                    fade_out = np.linspace(1, 0, cross_fade_samples)
-                    fade_in = np.linspace(0, 1, cross_fade_samples)
-
-                    # Cross-faded overlap
-                    cross_faded_overlap = prev_overlap * fade_out + next_overlap * fade_in
-
-                    # Combine
-                    new_wave = np.concatenate(
-                        [prev_wave[:-cross_fade_samples], cross_faded_overlap, next_wave[cross_fade_samples:]]
-                    )
-
-                    final_wave = new_wave
+                # Combine all generated waves with cross-fading, into a single preallocated buffer
+                cross_fade_samples = int(cross_fade_duration * target_sample_rate)
+                fade_out = np.linspace(1, 0, cross_fade_samples, dtype=np.float32)
+                fade_in = np.linspace(0, 1, cross_fade_samples, dtype=np.float32)
+
+                # Calculate cross-fade samples of each join, ensuring it does not exceed wave lengths
+                overlaps = []
+                total_len = len(generated_waves[0])
+                for next_wave in generated_waves[1:]:
+                    overlap = min(cross_fade_samples, total_len, len(next_wave))
+                    overlaps.append(overlap)
+                    total_len += len(next_wave) - overlap
+
+                final_wave = np.empty(total_len, dtype=np.float32)
+                end = len(generated_waves[0])
+                final_wave[:end] = generated_waves[0]
+                for next_wave, overlap in zip(generated_waves[1:], overlaps):
+                    start = end - overlap
+                    if overlap > 0:
+                        if overlap < cross_fade_samples:
+                            join_fade_out = np.linspace(1, 0, overlap, dtype=np.float32)
+                            join_fade_in = np.linspace(0, 1, overlap, dtype=np.float32)
+                        else:
+                            join_fade_out, join_fade_in = fade_out, fade_in
+                        # Cross-faded overlap, written over the tail of the previous wave
+                        final_wave[start:end] *= join_fade_out
+                        final_wave[start:end] += next_wave[:overlap] * join_fade_in
+                    final_wave[end : start + len(next_wave)] = next_wave[overlap:]
+                    end = start + len(next_wave)
 
             # Create a combined spectrogram
             combined_spectrogram = np.concatenate(spectrograms, axis=1)
@@ -584,18 +593,30 @@ def infer_batch_process(
 # remove silence from generated wav
 
 
-def remove_silence_for_generated_wav(filename):
-    aseg = AudioSegment.from_file(filename)
+def _remove_silence_segments(aseg):
     non_silent_segs = silence.split_on_silence(
         aseg, min_silence_len=1000, silence_thresh=-50, keep_silence=500, seek_step=10
     )
     non_silent_wave = AudioSegment.silent(duration=0)
     for non_silent_seg in non_silent_segs:
         non_silent_wave += non_silent_seg
-    aseg = non_silent_wave
+    return non_silent_wave
+
+
+def remove_silence_for_generated_wav(filename):
+    aseg = AudioSegment.from_file(filename)
+    aseg = _remove_silence_segments(aseg)
     aseg.export(filename, format="wav")
 
 
+def remove_silence_from_wave(wave, sample_rate):
+    # same as remove_silence_for_generated_wav, but on an in-memory 16-bit mono wave instead of a wav file
+    pcm = (np.clip(wave, -1.0, 1.0) * 32767).astype(np.int16)
+    aseg = AudioSegment(pcm.tobytes(), frame_rate=sample_rate, sample_width=2, channels=1)
+    aseg = _remove_silence_segments(aseg)
+    return np.array(aseg.get_array_of_samples(), dtype=np.float32) / 32768
+
+
 # save spectrogram
 
 